@@ -8,6 +8,11 @@ import uuid
 import time
 import json
 import re  # 👈 新增：用於解析文字的正則表達式套件
+from ledger_utils import (
+    normalize_tag, normalize_note, installment_amount, transaction_fingerprint, match_duplicates,
+    row_has_changed, is_new_row, budget_keys_for_row, collect_budget_deltas, escape_like,
+    parse_amount, reconcile_statement,
+)
 
 # --- 1. 設定頁面配置 ---
 st.set_page_config(page_title="個人理財管家 Pro (Supabase版)", page_icon="💎", layout="wide")
@@ -83,15 +88,17 @@ if not st.session_state.logged_in:
 
 @st.cache_data(ttl=60)
 def get_app_settings():
-    if not supabase: return [], [], {}, []
+    if not supabase: return [], [], {}, [], {}
     
-    response = supabase.table('app_settings').select("*").execute()
+    # 累計支出 (budget_spent) 依月份另外讀，不隨歷史月份增長而拖慢設定載入
+    response = supabase.table('app_settings').select("*").neq("section", "budget_spent").execute()
     data = response.data
     
     expense_cats = []
     income_cats = []
     monthly_budgets = {}
     subscriptions = [] 
+    category_budgets = {}
     
     default_expense = "飲食,交通,娛樂,購物,居住,醫療,投資,寵物,進修,其他"
     default_income = "薪資,獎金,投資收益,退款,兼職,其他"
@@ -112,11 +119,15 @@ def get_app_settings():
                 sub_data['name'] = key
                 subscriptions.append(sub_data)
             except: pass
+        elif section == 'category_budget':
+            try:
+                category_budgets[key] = json.loads(value)
+            except: pass
     
     if not expense_cats: expense_cats = default_expense.split(',')
     if not income_cats: income_cats = default_income.split(',')
             
-    return expense_cats, income_cats, monthly_budgets, subscriptions
+    return expense_cats, income_cats, monthly_budgets, subscriptions, category_budgets
 
 def update_monthly_budget(month_str, amount):
     existing = supabase.table('app_settings').select("id").eq("section", "budget").eq("key_name", month_str).execute()
@@ -161,12 +172,95 @@ def delete_subscription_template(name):
     supabase.table('app_settings').delete().eq("section", "subscription").eq("key_name", name).execute()
     get_app_settings.clear()
 
-def generate_subscriptions_for_month(date_obj, subs_list):
-    start_date = date_obj.replace(day=1).strftime("%Y-%m-%d")
-    next_month = (date_obj.replace(day=28) + timedelta(days=4)).replace(day=1).strftime("%Y-%m-%d")
+# ==========================================
+# 🎯 分類/標籤預算 (增量累計)
+# ==========================================
+# 預算設定存在 section='category_budget'，key 為 "category:飲食" 或 "tag:#旅遊"
+# 各月份累計支出存在 section='budget_spent'，key 為 "2026-10|category:飲食"，每次寫入交易時增量更新
+
+def check_budget_alert(month, key, old_spent, new_spent, budget_cfg):
+    """寫入當下檢查是否跨過警示門檻或超支，訊息暫存在 session 由主畫面顯示"""
+    limit = float(budget_cfg.get('limit', 0))
+    if limit <= 0: return
+    scope, name = key.split(":", 1)
+    label = f"{'類別' if scope == 'category' else '標籤'}「{name}」"
+    alert_ratio = float(budget_cfg.get('alert_ratio', 0.8))
+
+    if old_spent <= limit < new_spent:
+        msg = f"🚨 {month} {label} 已超支：${new_spent:,.0f} / ${limit:,.0f}"
+    elif old_spent < limit * alert_ratio <= new_spent:
+        msg = f"⚠️ {month} {label} 已用 {new_spent / limit:.0%}：${new_spent:,.0f} / ${limit:,.0f}"
+    else:
+        return
+    st.session_state.setdefault('budget_alerts', []).append(msg)
+
+def apply_budget_deltas(deltas):
+    """把增量加到有設定預算的累計支出上 (不重新計算整個帳本)"""
+    if not supabase: return
+    *_, category_budgets = get_app_settings()
+    deltas = {k: v for k, v in deltas.items() if k[1] in category_budgets and v != 0}
+    if not deltas: return
+
+    # 由資料庫 apply_budget_deltas() 原子地 value = value + delta，並回傳更新前後的值
+    payload = [{"key_name": f"{month}|{key}", "delta": delta} for (month, key), delta in deltas.items()]
+    try:
+        response = supabase.rpc("apply_budget_deltas", {"p_deltas": payload}).execute()
+    except Exception as e:
+        # 交易本身已寫入成功，只是累計值沒跟上；重新儲存該預算即可從帳本重建
+        st.warning(f"⚠️ 預算累計更新失敗，請到「分類/標籤預算」重新儲存以重建：{e}")
+        return
+
+    for row in response.data:
+        month, key = row['budget_key'].split("|", 1)
+        check_budget_alert(month, key, float(row['old_spent']), float(row['new_spent']), category_budgets[key])
+    get_budget_status.clear()
+
+@st.cache_data(ttl=60)
+def get_budget_status(month_str):
+    """只讀取單一月份的累計支出：預算 key -> 已花費"""
+    if not supabase: return {}
+    response = supabase.table('app_settings').select("key_name,value").eq("section", "budget_spent").like("key_name", f"{month_str}|%").execute()
+    return {row['key_name'].split("|", 1)[1]: float(row['value']) for row in response.data}
+
+def rebuild_budget_totals(key):
+    """新增預算時從帳本回填一次各月累計，之後都靠增量更新"""
+    supabase.table('app_settings').delete().eq("section", "budget_spent").like("key_name", f"%|{escape_like(key)}").execute()
+    ledger = get_data()
+    if ledger.empty: return
+
+    totals = {}
+    for row in ledger[ledger['type'] == '支出'].to_dict('records'):
+        if key in budget_keys_for_row(row):
+            month = str(row['date'])[:7]
+            totals[month] = totals.get(month, 0) + float(row['amount'])
+    if totals:
+        supabase.table('app_settings').insert([
+            {"section": "budget_spent", "key_name": f"{month}|{key}", "value": str(spent)} for month, spent in totals.items()
+        ]).execute()
+
+def save_category_budget(scope, name, limit, alert_ratio):
+    key = f"{scope}:{name}"
+    json_str = json.dumps({"limit": limit, "alert_ratio": alert_ratio}, ensure_ascii=False)
+    existing = supabase.table('app_settings').select("id").eq("section", "category_budget").eq("key_name", key).execute()
     
-    response = supabase.table('transactions').select("note").gte("date", start_date).lt("date", next_month).is_("deleted_at", "null").execute()
-    existing_notes = set([row['note'] for row in response.data if row.get('note')])
+    if existing.data:
+        supabase.table('app_settings').update({"value": json_str}).eq("id", existing.data[0]['id']).execute()
+    else:
+        supabase.table('app_settings').insert({"section": "category_budget", "key_name": key, "value": json_str}).execute()
+    # 每次儲存都從帳本重建一次累計值，也可用來修正偏差
+    rebuild_budget_totals(key)
+    get_app_settings.clear()
+    get_budget_status.clear()
+
+def delete_category_budget(key):
+    supabase.table('app_settings').delete().eq("section", "category_budget").eq("key_name", key).execute()
+    supabase.table('app_settings').delete().eq("section", "budget_spent").like("key_name", f"%|{escape_like(key)}").execute()
+    get_app_settings.clear()
+    get_budget_status.clear()
+
+def generate_subscriptions_for_month(date_obj, subs_list):
+    month_str = date_obj.strftime("%Y-%m")
+    month_notes = get_month_notes(month_str)
     
     rows_to_add = []
     added_count = 0
@@ -174,7 +268,7 @@ def generate_subscriptions_for_month(date_obj, subs_list):
     
     for sub in subs_list:
         target_note = f"{sub['name']} ({sub['note']})"
-        if target_note in existing_notes:
+        if normalize_note(target_note) in month_notes:
             skipped_count += 1
             continue
             
@@ -193,7 +287,8 @@ def generate_subscriptions_for_month(date_obj, subs_list):
         
     if rows_to_add:
         supabase.table('transactions').insert(rows_to_add).execute()
-        get_data.clear()
+        apply_budget_deltas(collect_budget_deltas(new_rows=rows_to_add))
+        clear_ledger_cache()
         
     return added_count, skipped_count
 
@@ -221,31 +316,155 @@ def calculate_cash_flow_info(date_obj, payment_method):
 
 # --- 3. 讀取與寫入 ---
 
+LEDGER_COLUMNS = ["date", "cash_flow_date", "type", "category", "amount", "payment_method", "tags", "note", "id"]
+EDITOR_SORT_OPTIONS = {"消費日期": "date", "金額": "amount", "類別": "category", "付款方式": "payment_method"}
+
+def to_ledger_df(data):
+    """把資料庫回傳的 rows 轉成型別正確的 DataFrame"""
+    if not data:
+        return pd.DataFrame(columns=LEDGER_COLUMNS)
+
+    df = pd.DataFrame(data)
+    df['amount'] = pd.to_numeric(df['amount'], errors='coerce').fillna(0)
+    df['date'] = pd.to_datetime(df['date']).dt.date
+    df['cash_flow_date'] = pd.to_datetime(df['cash_flow_date']).dt.date
+    return df
+
+def select_all(build_query, page_size=1000):
+    """PostgREST 單次最多回傳 max_rows 筆 (預設 1000)，分頁讀到底"""
+    rows = []
+    offset = 0
+    while True:
+        batch = build_query().range(offset, offset + page_size - 1).execute().data
+        rows += batch
+        if len(batch) < page_size: return rows
+        offset += page_size
+
 @st.cache_data(ttl=60, show_spinner="正在從 Supabase 讀取資料...")
 def get_data():
     if not supabase: return pd.DataFrame()
 
     try:
-        response = supabase.table('transactions').select("*").is_("deleted_at", "null").execute()
-        data = response.data
+        data = select_all(lambda: supabase.table('transactions').select("*").is_("deleted_at", "null").order("id"))
     except Exception as e:
         st.error(f"讀取資料失敗: {e}")
         return pd.DataFrame()
 
-    if not data:
-        return pd.DataFrame(columns=["date", "cash_flow_date", "type", "category", "amount", "payment_method", "tags", "note", "id"])
+    return to_ledger_df(data)
 
-    df = pd.DataFrame(data)
-    df['amount'] = pd.to_numeric(df['amount'], errors='coerce').fillna(0)
-    df['date'] = pd.to_datetime(df['date']).dt.date
-    df['cash_flow_date'] = pd.to_datetime(df['cash_flow_date']).dt.date
-    
-    return df
+@st.cache_data(ttl=60)
+def get_records_page(start_date, end_date, tag_filter, type_filter, sort_col, descending, page, page_size):
+    """分頁讀取交易：篩選、排序與切頁都在資料庫完成，每次只下載一頁"""
+    if not supabase: return pd.DataFrame(columns=LEDGER_COLUMNS), 0
 
-def add_transaction(date_obj, record_type, category, amount, payment_method, note, tags, installment_months=1):
-    if not supabase: return
+    try:
+        query = supabase.table('transactions').select("*", count="exact") \
+            .gte("date", start_date).lt("date", end_date).is_("deleted_at", "null")
+        if tag_filter:
+            query = query.contains("tag_list", [normalize_tag(tag_filter)])
+        if type_filter:
+            query = query.eq("type", type_filter)
+
+        offset = page * page_size
+        response = query.order(sort_col, desc=descending).order("id") \
+            .range(offset, offset + page_size - 1).execute()
+    except Exception as e:
+        st.error(f"讀取分頁資料失敗: {e}")
+        return pd.DataFrame(columns=LEDGER_COLUMNS), 0
+
+    return to_ledger_df(response.data), (response.count or 0)
+
+@st.cache_data(ttl=60)
+def get_tagged_records(start_date, end_date, tag):
+    """用 tag_list 的 GIN 索引查出某標籤在期間內的交易"""
+    if not supabase: return pd.DataFrame(columns=LEDGER_COLUMNS)
+
+    try:
+        data = select_all(lambda: supabase.table('transactions').select("*").gte("date", start_date).lt("date", end_date)
+                          .is_("deleted_at", "null").contains("tag_list", [normalize_tag(tag)]).order("id"))
+    except Exception as e:
+        st.error(f"標籤查詢失敗: {e}")
+        return pd.DataFrame(columns=LEDGER_COLUMNS)
+
+    return to_ledger_df(data)
+
+@st.cache_data(ttl=60)
+def get_tag_totals(start_date, end_date, tag=None):
+    """由資料庫 tag_totals() 彙總各標籤的筆數與支出，每個標籤只回傳一列"""
+    if not supabase: return pd.DataFrame(columns=['tag', 'count', 'total_spent'])
+
+    params = {"p_start": start_date, "p_end": end_date}
+    if tag: params["p_tag"] = normalize_tag(tag)
+    response = supabase.rpc("tag_totals", params).execute()
+    tag_df = pd.DataFrame(response.data, columns=['tag', 'count', 'total_spent'])
+    tag_df['total_spent'] = pd.to_numeric(tag_df['total_spent'], errors='coerce').fillna(0)
+    return tag_df
+
+@st.cache_data(ttl=60)
+def get_range_records(start_date, end_date, dates=()):
+    """只讀取期間 [start_date, end_date) 或指定日期的交易明細"""
+    if not supabase: return pd.DataFrame(columns=LEDGER_COLUMNS)
+
+    def build_query():
+        query = supabase.table('transactions').select("*").is_("deleted_at", "null")
+        if dates:
+            query = query.in_("date", list(dates))
+        else:
+            query = query.gte("date", start_date).lt("date", end_date)
+        return query.order("id")
+
+    try:
+        data = select_all(build_query)
+    except Exception as e:
+        st.error(f"讀取資料失敗: {e}")
+        return pd.DataFrame(columns=LEDGER_COLUMNS)
+
+    return to_ledger_df(data)
+
+@st.cache_data(ttl=60)
+def get_ledger_totals(start_date=None, end_date=None, group=None, sub_group=None,
+                      record_type=None, category=None, payment_method=None, tag=None):
+    """呼叫資料庫 ledger_totals() 取得分組加總 (group_key, sub_key, type, total, count)。
+    group / sub_group 可用 category、payment_method、date、week、month、cash_flow_date。"""
+    columns = ['group_key', 'sub_key', 'type', 'total', 'count']
+    if not supabase: return pd.DataFrame(columns=columns)
+
+    params = {
+        "p_start": start_date, "p_end": end_date, "p_group": group, "p_sub_group": sub_group,
+        "p_type": record_type, "p_category": category, "p_payment_method": payment_method,
+        "p_tag": normalize_tag(tag) if tag else None,
+    }
+    try:
+        response = supabase.rpc("ledger_totals", {k: v for k, v in params.items() if v is not None}).execute()
+    except Exception as e:
+        st.error(f"彙總查詢失敗: {e}")
+        return pd.DataFrame(columns=columns)
+
+    totals = pd.DataFrame(response.data, columns=columns)
+    totals['total'] = pd.to_numeric(totals['total'], errors='coerce').fillna(0)
+    totals['count'] = pd.to_numeric(totals['count'], errors='coerce').fillna(0).astype(int)
+    return totals
+
+def sum_by_type(totals, record_type):
+    return totals[totals['type'] == record_type]['total'].sum()
 
-    monthly_amount = round(amount / installment_months)
+def clear_ledger_cache():
+    """交易資料有寫入時，清掉所有讀取快取"""
+    get_data.clear()
+    get_range_records.clear()
+    get_ledger_totals.clear()
+    get_records_page.clear()
+    get_tagged_records.clear()
+    get_tag_totals.clear()
+    get_fingerprint_index.clear()
+    get_month_notes.clear()
+    get_card_records.clear()
+    # 分頁編輯器的快照依此版本號重建，避免拿舊快照比對新資料
+    st.session_state.ledger_version = st.session_state.get('ledger_version', 0) + 1
+
+def build_transaction_rows(date_obj, record_type, category, amount, payment_method, note, tags, installment_months=1):
+    """組出要寫入的資料列 (分期會展開成多筆)"""
+    monthly_amount = installment_amount(amount, installment_months)
     rows_to_add = []
     current_date = date_obj
 
@@ -270,8 +489,66 @@ def add_transaction(date_obj, record_type, category, amount, payment_method, not
         rows_to_add.append(row_data)
         current_date = current_date + relativedelta(months=1)
 
+    return rows_to_add
+
+def add_transaction(date_obj, record_type, category, amount, payment_method, note, tags, installment_months=1):
+    if not supabase: return
+
+    rows_to_add = build_transaction_rows(date_obj, record_type, category, amount, payment_method, note, tags, installment_months)
     supabase.table('transactions').insert(rows_to_add).execute()
-    get_data.clear()
+    apply_budget_deltas(collect_budget_deltas(new_rows=rows_to_add))
+    clear_ledger_cache()
+
+def add_transactions_bulk(records, record_type="支出"):
+    """批次匯入：所有資料列合併成一次 insert"""
+    if not supabase or not records: return
+
+    rows_to_add = []
+    for item in records:
+        rows_to_add += build_transaction_rows(item['date'], record_type, item['category'], item['amount'],
+                                              item['payment_method'], item['note'], item['tags'])
+    supabase.table('transactions').insert(rows_to_add).execute()
+    apply_budget_deltas(collect_budget_deltas(new_rows=rows_to_add))
+    clear_ledger_cache()
+
+# ==========================================
+# 🧬 重複交易偵測 (指紋索引)
+# ==========================================
+@st.cache_data(ttl=60)
+def get_fingerprint_index(dates):
+    """只讀取批次涉及日期的交易，建立指紋索引：指紋 -> 筆數"""
+    fingerprints = {}
+    if not supabase or not dates: return fingerprints
+
+    rows = select_all(lambda: supabase.table('transactions').select("id,date,amount,note,payment_method")
+                      .in_("date", list(dates)).is_("deleted_at", "null").order("id"))
+    for row in rows:
+        fp = transaction_fingerprint(row['date'], row['amount'], row['note'], row['payment_method'])
+        fingerprints[fp] = fingerprints.get(fp, 0) + 1
+    return fingerprints
+
+@st.cache_data(ttl=60)
+def get_month_notes(month_str):
+    """某月份已存在的備註 (正規化後)，供固定支出生成時查重"""
+    if not supabase: return set()
+    month_start = datetime.strptime(month_str, "%Y-%m").date()
+    month_end = month_start + relativedelta(months=1)
+    rows = select_all(lambda: supabase.table('transactions').select("id,note")
+                      .gte("date", month_start.isoformat()).lt("date", month_end.isoformat())
+                      .is_("deleted_at", "null").order("id"))
+    return {normalize_note(row['note']) for row in rows if row.get('note')}
+
+def find_duplicates(records):
+    """只載入批次涉及日期的指紋索引，再逐筆比對是否疑似重複 (金額依寫入時的取整方式比對)"""
+    batch_dates = tuple(sorted({transaction_fingerprint(r['date'], 0, "", "")[0] for r in records}))
+    stored = [dict(r, amount=installment_amount(r['amount'])) for r in records]
+    return match_duplicates(stored, get_fingerprint_index(batch_dates))
+
+def fetch_transactions(ids):
+    """一次取回多筆交易的原始內容：id -> row"""
+    if not supabase or not ids: return {}
+    response = supabase.table('transactions').select("*").in_("id", list(ids)).execute()
+    return {row['id']: row for row in response.data}
 
 def safe_update_transaction(edited_row, original_row):
     uid = edited_row['id']
@@ -289,19 +566,188 @@ def safe_update_transaction(edited_row, original_row):
     }
     
     try:
-        supabase.table('transactions').update(update_data).eq("id", uid).execute()
-        return True
+        response = supabase.table('transactions').update(update_data).eq("id", uid).is_("deleted_at", "null").execute()
     except Exception as e:
         st.error(f"更新失敗 ID {uid}: {e}")
         return False
 
+    # 已被其他分頁刪除的資料列不會更新；沒有原始內容時無從扣回舊金額，兩者都不動預算
+    if not response.data: return False
+    if original_row is not None:
+        apply_budget_deltas(collect_budget_deltas([original_row], [update_data]))
+    return True
+
 def delete_transaction(target_id):
     if not supabase: return
     try:
         now_str = datetime.now().isoformat()
-        supabase.table('transactions').update({"deleted_at": now_str}).eq("id", target_id).execute()
+        # 只刪除還活著的資料列，重複刪除時不會回傳資料，也就不會再扣一次預算
+        response = supabase.table('transactions').update({"deleted_at": now_str}).eq("id", target_id).is_("deleted_at", "null").execute()
     except Exception as e:
         st.error(f"刪除失敗：{e}")
+        return
+
+    # 回傳的資料列除了 deleted_at 外就是刪除前的內容，直接拿來扣回預算
+    apply_budget_deltas(collect_budget_deltas(old_rows=response.data))
+
+# ==========================================
+# 🗄️ 封存：把舊的軟刪除資料搬離主表
+# ==========================================
+def run_archive_job(retention_days, batch_size, closed_before=None, max_batches=50):
+    """分批呼叫 archive_transactions()，每批筆數有上限，回傳 (搬移筆數, 是否還有剩)"""
+    if not supabase: return 0, False
+
+    params = {"p_retention_days": int(retention_days), "p_batch_size": int(batch_size)}
+    if closed_before: params["p_closed_before"] = closed_before.isoformat()
+
+    total_moved = 0
+    has_more = False
+    for _ in range(max_batches):
+        moved = supabase.rpc("archive_transactions", params).execute().data or 0
+        total_moved += moved
+        has_more = moved >= batch_size
+        if not has_more: break
+
+    if total_moved:
+        clear_ledger_cache()
+    return total_moved, has_more
+
+@st.cache_data(ttl=300)
+def get_archived_records(start_date, end_date):
+    """需要時才查封存表 (含已刪除與已結算年度的資料)"""
+    if not supabase: return pd.DataFrame(columns=LEDGER_COLUMNS)
+
+    response = supabase.table('transactions_archive').select("*").gte("date", start_date).lt("date", end_date).order("date").execute()
+    return to_ledger_df(response.data)
+
+# ==========================================
+# 📄 分頁編輯：暫存跨頁的未儲存變更
+# ==========================================
+def get_pending_edits():
+    """取得 session 中尚未寫入資料庫的變更 (修改 / 刪除 / 新增)"""
+    if 'editor_pending' not in st.session_state:
+        st.session_state.editor_pending = {"edits": {}, "deletes": set(), "adds": {}}
+    return st.session_state.editor_pending
+
+def reset_pending_edits():
+    st.session_state.editor_pending = {"edits": {}, "deletes": set(), "adds": {}}
+    st.session_state.editor_generation = st.session_state.get('editor_generation', 0) + 1
+
+def build_page_snapshot(base_df, page_key):
+    """以資料庫原始頁面為底，疊上暫存的修改/刪除/新增，作為編輯器的輸入"""
+    pending = get_pending_edits()
+    rows = [
+        pending['edits'].get(row['id'], row)
+        for row in base_df.to_dict('records')
+        if row['id'] not in pending['deletes']
+    ]
+    rows += pending['adds'].get(page_key, [])
+    return pd.DataFrame(rows, columns=base_df.columns)
+
+def collect_page_changes(edited_df, base_df, page_key):
+    """只針對目前這一頁比對差異，更新暫存的變更"""
+    pending = get_pending_edits()
+    base_map = base_df.set_index('id').to_dict('index')
+    seen_ids = set()
+    new_rows = []
+
+    for row in edited_df.to_dict('records'):
+        uid = row.get('id')
+        if is_new_row(uid):
+            new_rows.append(row)
+            continue
+        seen_ids.add(uid)
+        if uid not in base_map: continue
+
+        if row_has_changed(row, base_map[uid]):
+            pending['edits'][uid] = row
+        else:
+            pending['edits'].pop(uid, None)
+
+    for uid in base_map:
+        if uid in seen_ids:
+            pending['deletes'].discard(uid)
+        else:
+            pending['deletes'].add(uid)
+            pending['edits'].pop(uid, None)
+
+    if new_rows:
+        pending['adds'][page_key] = new_rows
+    else:
+        pending['adds'].pop(page_key, None)
+
+def flush_pending_edits():
+    """把所有頁面累積的變更一次寫入資料庫"""
+    pending = get_pending_edits()
+    changes_count = 0
+    delete_count = 0
+    add_count = 0
+
+    for uid in pending['deletes']:
+        delete_transaction(uid)
+        delete_count += 1
+
+    originals = fetch_transactions(pending['edits'].keys())
+    for uid, row in pending['edits'].items():
+        if safe_update_transaction(row, originals.get(uid)):
+            changes_count += 1
+
+    for rows in pending['adds'].values():
+        for row in rows:
+            if not row.get('date') or not row.get('amount') or not row.get('category'): continue
+            add_transaction(row['date'], row.get('type') or "支出", row['category'], float(row['amount']),
+                            row.get('payment_method') or "現金", row.get('note') or "", row.get('tags') or "")
+            add_count += 1
+
+    reset_pending_edits()
+    clear_ledger_cache()
+    return changes_count, delete_count, add_count
+
+# ==========================================
+# 🧾 信用卡帳單對帳 (Sort-Merge Join)
+# ==========================================
+@st.cache_data(ttl=60)
+def get_card_records(card, start_date, end_date):
+    """在資料庫篩出某張卡在期間 [start_date, end_date) 的支出"""
+    if not supabase: return pd.DataFrame(columns=LEDGER_COLUMNS)
+
+    try:
+        data = select_all(lambda: supabase.table('transactions').select("*")
+                          .eq("payment_method", card).eq("type", "支出")
+                          .gte("date", start_date).lt("date", end_date)
+                          .is_("deleted_at", "null").order("id"))
+    except Exception as e:
+        st.error(f"讀取信用卡紀錄失敗: {e}")
+        return pd.DataFrame(columns=LEDGER_COLUMNS)
+
+    return to_ledger_df(data)
+
+def get_statement_ledger(card, billing_month):
+    """取出某張卡、某個帳單月份 (依 calculate_cash_flow_info 判定) 的支出紀錄"""
+    # 先在資料庫用日期粗篩：帳單月份 M 的消費一定落在 M-1 月初 ~ M 月底之間
+    month_start = datetime.strptime(billing_month, "%Y-%m").date()
+    window_start = month_start - relativedelta(months=1)
+    window_end = month_start + relativedelta(months=1)
+    card_df = get_card_records(card, window_start.isoformat(), window_end.isoformat())
+    if card_df.empty: return card_df
+
+    target_label = f"{billing_month} 帳單"
+    in_period = [calculate_cash_flow_info(d, card)[1] == target_label for d in card_df['date']]
+    return card_df[in_period]
+
+def parse_statement_csv(raw, date_col, amount_col, desc_col):
+    """把讀入的帳單 CSV 轉成 [{date, amount, description}]，另外回傳無法解析日期或金額的原始列"""
+    dates = pd.to_datetime(raw[date_col], errors='coerce')
+    amounts = raw[amount_col].map(parse_amount)
+    descs = raw[desc_col].astype(str) if desc_col else pd.Series([""] * len(raw))
+
+    lines, skipped = [], []
+    for idx, d, amt, desc in zip(raw.index, dates, amounts, descs):
+        if pd.isna(d) or amt is None:
+            skipped.append(idx)
+            continue
+        lines.append({"date": d.date(), "amount": round(float(amt), 2), "description": desc})
+    return lines, raw.loc[skipped]
 
 # ==========================================
 # 🤖 智慧文字解析引擎 (NLP Parser)
@@ -411,8 +857,9 @@ if st.sidebar.button("🔒 登出系統"):
     st.rerun()
 
 # 讀取設定與資料
-expense_cats, income_cats, monthly_budgets, subscriptions = get_app_settings()
-df = get_data()
+expense_cats, income_cats, monthly_budgets, subscriptions, category_budgets = get_app_settings()
+# 主畫面只需要月份清單 (每月一兩列的彙總)，不再下載整個帳本
+month_totals = get_ledger_totals(group="month")
 
 # ==========================================
 # 🔥 側邊欄：智慧批次記帳 (新功能)
@@ -421,30 +868,50 @@ with st.sidebar.expander("🤖 智慧文字批次記帳", expanded=True):
     st.caption("支援日期切換 (如 2/15)、標籤 (#旅遊) 與算式。系統會自動幫您分類。")
     bulk_text = st.text_area("貼上紀錄", height=200, placeholder="2/15 #辦年貨\n水果1680\n7-11  163\n2/19\n午餐 528+220 = 748")
     
-    if st.button("⚡ 智慧解析並寫入", use_container_width=True):
+    if st.button("🔍 智慧解析 (預覽)", use_container_width=True):
         if bulk_text:
             parsed_data = parse_bulk_text(bulk_text, expense_cats)
             
             if not parsed_data:
+                st.session_state.pop('bulk_preview', None)
                 st.warning("⚠️ 找不到可識別的帳務資料，請檢查格式。")
             else:
-                with st.spinner(f"正在批次寫入 {len(parsed_data)} 筆資料..."):
-                    for item in parsed_data:
-                        add_transaction(
-                            date_obj=item['date'], 
-                            record_type="支出", 
-                            category=item['category'], 
-                            amount=item['amount'], 
-                            payment_method=item['payment_method'], 
-                            note=item['note'], 
-                            tags=item['tags']
-                        )
-                    st.success(f"✅ 成功匯入 {len(parsed_data)} 筆資料！")
-                    time.sleep(1.5)
-                    st.rerun()
+                dup_flags = find_duplicates(parsed_data)
+                st.session_state.bulk_preview = [dict(item, duplicate=flag) for item, flag in zip(parsed_data, dup_flags)]
         else:
             st.warning("請先輸入文字")
 
+    if st.session_state.get('bulk_preview'):
+        preview = st.session_state.bulk_preview
+        dup_count = sum(1 for item in preview if item['duplicate'])
+        st.dataframe(
+            pd.DataFrame(preview)[['duplicate', 'date', 'category', 'amount', 'note', 'tags']],
+            column_config={
+                "duplicate": st.column_config.CheckboxColumn("疑似重複"),
+                "amount": st.column_config.NumberColumn("金額", format="$ %d"),
+            },
+            use_container_width=True,
+            hide_index=True
+        )
+        skip_dups = False
+        if dup_count:
+            st.warning(f"⚠️ 有 {dup_count} 筆與既有紀錄相同 (日期、金額、備註、付款方式)")
+            skip_dups = st.checkbox("略過疑似重複的項目", value=True)
+
+        col_b1, col_b2 = st.columns(2)
+        if col_b1.button("⚡ 確認寫入", use_container_width=True):
+            to_write = [item for item in preview if not (skip_dups and item['duplicate'])]
+            if to_write:
+                with st.spinner(f"正在批次寫入 {len(to_write)} 筆資料..."):
+                    add_transactions_bulk(to_write)
+            st.session_state.pop('bulk_preview', None)
+            st.success(f"✅ 成功匯入 {len(to_write)} 筆資料！" + (f" (略過 {dup_count} 筆重複)" if skip_dups else ""))
+            time.sleep(1.5)
+            st.rerun()
+        if col_b2.button("取消", use_container_width=True):
+            st.session_state.pop('bulk_preview', None)
+            st.rerun()
+
 st.sidebar.markdown("---")
 
 # --- 側邊欄：新增交易 (手動單筆) ---
@@ -538,17 +1005,68 @@ with st.sidebar.expander("🔄 訂閱/固定支出管家"):
         else:
             st.warning("請先新增樣板")
 
+# 🔥 側邊欄：分類/標籤預算
+with st.sidebar.expander("🎯 分類/標籤預算"):
+    st.caption("替特定類別或標籤設定每月上限，記帳時即時提醒。")
+    
+    budget_scope = st.radio("預算對象", ["類別", "標籤"], horizontal=True, key="budget_scope")
+    if budget_scope == "類別":
+        budget_name = st.selectbox("類別", expense_cats, key="budget_cat")
+    else:
+        budget_name = st.text_input("標籤", placeholder="例如: #日本旅遊", key="budget_tag").strip()
+        if budget_name and not budget_name.startswith("#"): budget_name = f"#{budget_name}"
+    budget_limit = st.number_input("每月上限", min_value=0.0, step=500.0, key="budget_limit")
+    budget_ratio = st.slider("提醒門檻", min_value=0.5, max_value=1.0, value=0.8, step=0.05, key="budget_ratio")
+    
+    if st.button("➕ 儲存預算"):
+        if budget_name and budget_limit > 0:
+            with st.spinner("正在建立預算..."):
+                save_category_budget("category" if budget_scope == "類別" else "tag", budget_name, budget_limit, budget_ratio)
+            st.success(f"已設定 {budget_name} 預算")
+            st.rerun()
+        else:
+            st.warning("請輸入名稱與金額")
+    
+    st.markdown("---")
+    for key, cfg in category_budgets.items():
+        c1, c2 = st.columns([3, 1])
+        c1.text(f"{key.split(':', 1)[1]} ${float(cfg.get('limit', 0)):,.0f}")
+        if c2.button("❌", key=f"del_budget_{key}"):
+            delete_category_budget(key)
+            st.rerun()
+
+# 🔥 側邊欄：資料封存
+with st.sidebar.expander("🗄️ 資料封存"):
+    st.caption("把刪除超過保留天數的紀錄 (及已結算年度) 搬到封存表，讓日常查詢只掃有效資料。")
+    
+    retention_days = st.number_input("刪除紀錄保留天數", min_value=0, value=90, step=30)
+    archive_batch = st.number_input("每批筆數", min_value=100, max_value=5000, value=500, step=100)
+    archive_years = st.checkbox("一併封存已結算年度")
+    closed_before = None
+    if archive_years:
+        close_year = st.number_input("封存此年度 (含) 以前", min_value=2000, max_value=datetime.now().year - 1, value=datetime.now().year - 2)
+        closed_before = date(int(close_year) + 1, 1, 1)
+    
+    if st.button("🗄️ 執行封存"):
+        with st.spinner("正在分批封存..."):
+            try:
+                moved, has_more = run_archive_job(retention_days, archive_batch, closed_before)
+            except Exception as e:
+                st.error(f"封存失敗: {e}")
+            else:
+                st.success(f"已封存 {moved} 筆。" + (" 尚有資料未處理，可再執行一次。" if has_more else ""))
+
 # --- 主畫面 ---
 st.title("💎 個人理財管家 Pro")
 
-if df.empty:
+for alert_msg in st.session_state.pop('budget_alerts', []):
+    st.warning(alert_msg)
+
+if month_totals.empty:
     st.info("💡 目前資料庫中沒有資料，請建立第一筆帳務！")
 else:
-    stats_df = df.copy()
-    stats_df['month_str'] = stats_df['date'].apply(lambda x: x.strftime("%Y-%m"))
-    
     current_month_str = datetime.now().strftime("%Y-%m")
-    available_months = sorted(stats_df['month_str'].unique(), reverse=True)
+    available_months = sorted(month_totals['group_key'].dropna().unique(), reverse=True)
     if current_month_str not in available_months: available_months.insert(0, current_month_str)
     
     try:
@@ -560,16 +1078,19 @@ else:
     with col_filter1:
         selected_month = st.selectbox("📅 選擇月份", available_months, index=default_index)
     with col_filter2:
-        tag_filter = st.text_input("🔍 標籤搜尋", "")
+        tag_filter = st.text_input("🔍 標籤搜尋", "", placeholder="例如: #日本旅遊").strip()
+
+    month_start = datetime.strptime(selected_month, "%Y-%m").date()
+    month_end = month_start + relativedelta(months=1)
 
-    current_month_df = stats_df[stats_df['month_str'] == selected_month]
-    if tag_filter:
-        current_month_df = current_month_df[current_month_df['tags'].astype(str).str.contains(tag_filter)]
+    # 所有加總都由資料庫 ledger_totals() 計算
+    month_range = dict(start_date=month_start.isoformat(), end_date=month_end.isoformat(), tag=tag_filter or None)
+    type_totals = get_ledger_totals(**month_range)
 
     budget = monthly_budgets.get(selected_month, 20000)
 
-    total_income = current_month_df[current_month_df['type'] == '收入']['amount'].sum()
-    total_expense = current_month_df[current_month_df['type'] == '支出']['amount'].sum()
+    total_income = sum_by_type(type_totals, '收入')
+    total_expense = sum_by_type(type_totals, '支出')
     net_balance = total_income - total_expense
     remaining = budget - total_expense
     
@@ -586,51 +1107,57 @@ else:
             st.success("預算已更新！")
             st.rerun()
 
+    if category_budgets:
+        # 累計值由寫入時增量維護，這裡只讀本月的少量資料列
+        budget_status = get_budget_status(selected_month)
+        with st.expander(f"🎯 分類/標籤預算 ({selected_month})", expanded=True):
+            for key, cfg in category_budgets.items():
+                limit = float(cfg.get('limit', 0))
+                spent = budget_status.get(key, 0.0)
+                ratio = spent / limit if limit > 0 else 0
+                icon = "🚨" if ratio > 1 else ("⚠️" if ratio >= float(cfg.get('alert_ratio', 0.8)) else "✅")
+                st.progress(min(ratio, 1.0), text=f"{icon} {key.split(':', 1)[1]}：${spent:,.0f} / ${limit:,.0f} (剩餘 ${limit - spent:,.0f})")
+
     st.markdown("---")
 
     # 🔥 Tab 5: 🧮 自訂/多選計算機
-    tab1, tab2, tab3, tab4, tab5 = st.tabs(["📊 收支概況", "💳 現金流分析", "🏷️ 專案/標籤分析", "📅 每日明細", "🧮 自訂/多選計算機"])
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["📊 收支概況", "💳 現金流分析", "🏷️ 專案/標籤分析", "📅 每日明細", "🧮 自訂/多選計算機", "🧾 帳單對帳"])
     
     with tab1:
         cc1, cc2 = st.columns(2)
         with cc1:
-            if not current_month_df[current_month_df['type']=='支出'].empty:
-                fig = px.pie(current_month_df[current_month_df['type']=='支出'], values='amount', names='category', title='支出類別占比', hole=0.4)
+            cat_totals = get_ledger_totals(**month_range, group="category", record_type="支出")
+            if not cat_totals.empty:
+                fig = px.pie(cat_totals, values='total', names='group_key', title='支出類別占比', hole=0.4)
                 st.plotly_chart(fig, use_container_width=True)
             else:
                 st.info("無支出資料")
         with cc2:
             period = st.radio("趨勢週期", ["日", "週"], horizontal=True, key='trend_p')
-            trend_df = current_month_df.copy()
-            trend_df['date'] = pd.to_datetime(trend_df['date'])
-            freq = 'D' if period == '日' else 'W-MON'
-            try:
-                g_df = trend_df.groupby([pd.Grouper(key='date', freq=freq), 'type'])['amount'].sum().reset_index()
-                fig_trend = px.bar(g_df, x='date', y='amount', color='type', barmode='group', 
+            g_df = get_ledger_totals(**month_range, group="date" if period == '日' else "week")
+            if not g_df.empty:
+                g_df['date'] = pd.to_datetime(g_df['group_key'])
+                fig_trend = px.bar(g_df, x='date', y='total', color='type', barmode='group', 
                                    color_discrete_map={'支出': '#EF553B', '收入': '#00CC96'})
                 st.plotly_chart(fig_trend, use_container_width=True)
-            except:
+            else:
                 st.info("資料不足")
 
     with tab2:
-        cf_df = current_month_df.copy()
-        fig_cf = px.bar(cf_df[cf_df['type']=='支出'], x='cash_flow_date', y='amount', color='payment_method', 
+        cf_df = get_ledger_totals(**month_range, group="cash_flow_date", sub_group="payment_method", record_type="支出")
+        cf_df = cf_df.rename(columns={'group_key': 'cash_flow_date', 'sub_key': 'payment_method', 'total': 'amount'})
+        fig_cf = px.bar(cf_df, x='cash_flow_date', y='amount', color='payment_method', 
                         title='未來30天現金流出預測',
                         labels={'cash_flow_date': '預計扣款日', 'amount': '扣款金額'})
         st.plotly_chart(fig_cf, use_container_width=True)
 
     with tab3:
-        tags_series = current_month_df['tags'].str.split(',').explode().str.strip()
-        tags_series = tags_series[tags_series != ""]
-        if not tags_series.empty:
-            tag_counts = tags_series.value_counts().reset_index()
-            tag_counts.columns = ['tag', 'count']
-            tag_amounts = {}
-            for tag in tag_counts['tag']:
-                mask = current_month_df['tags'].astype(str).str.contains(tag)
-                amt = current_month_df[mask & (current_month_df['type']=='支出')]['amount'].sum()
-                tag_amounts[tag] = amt
-            tag_counts['total_spent'] = tag_counts['tag'].map(tag_amounts)
+        try:
+            tag_counts = get_tag_totals(month_start.isoformat(), month_end.isoformat(), tag_filter or None)
+        except Exception as e:
+            st.error(f"標籤彙總失敗: {e}")
+            tag_counts = pd.DataFrame(columns=['tag', 'count', 'total_spent'])
+        if not tag_counts.empty:
             st.dataframe(tag_counts, use_container_width=True)
             fig_tag = px.bar(tag_counts, x='tag', y='total_spent', title='各專案/標籤總支出')
             st.plotly_chart(fig_tag, use_container_width=True)
@@ -641,17 +1168,18 @@ else:
         st.subheader("📆 每日消費查詢")
         search_date = st.date_input("選擇日期", datetime.now(), key='daily_search')
         
-        daily_mask = df['date'] == search_date
-        daily_df = df[daily_mask]
+        next_date = search_date + timedelta(days=1)
+        daily_totals = get_ledger_totals(search_date.isoformat(), next_date.isoformat())
         
-        if not daily_df.empty:
-            d_income = daily_df[daily_df['type']=='收入']['amount'].sum()
-            d_expense = daily_df[daily_df['type']=='支出']['amount'].sum()
+        if not daily_totals.empty:
+            daily_df = get_range_records(search_date.isoformat(), next_date.isoformat())
+            d_income = sum_by_type(daily_totals, '收入')
+            d_expense = sum_by_type(daily_totals, '支出')
             
             k1, k2, k3 = st.columns(3)
             k1.metric("當日支出", f"${d_expense:,.0f}")
             k2.metric("當日收入", f"${d_income:,.0f}")
-            k3.metric("筆數", f"{len(daily_df)} 筆")
+            k3.metric("筆數", f"{daily_totals['count'].sum()} 筆")
             
             st.dataframe(
                 daily_df[['type', 'category', 'amount', 'note', 'payment_method', 'tags']],
@@ -670,21 +1198,29 @@ else:
         filter_type = st.radio("篩選方式", ["📆 連續日期範圍", "🎨 指定特定日期 (跳選)"], horizontal=True)
 
         range_df = pd.DataFrame()
+        range_totals = pd.DataFrame(columns=['group_key', 'sub_key', 'type', 'total', 'count'])
 
         if filter_type == "📆 連續日期範圍":
             col_d1, col_d2 = st.columns(2)
             d_start = col_d1.date_input("開始日期", datetime.now().replace(day=1), key="d_start")
             d_end = col_d2.date_input("結束日期", datetime.now(), key="d_end")
             
-            range_mask = (df['date'] >= d_start) & (df['date'] <= d_end)
-            range_df = df[range_mask].sort_values('date', ascending=False)
+            range_end = (d_end + timedelta(days=1)).isoformat()
+            range_df = get_range_records(d_start.isoformat(), range_end).sort_values('date', ascending=False)
+            range_totals = get_ledger_totals(d_start.isoformat(), range_end)
         
         else: # 跳選模式
-            available_dates = sorted(df['date'].dropna().unique(), reverse=True)
+            # 只列出所選月份及前兩個月的日期，彙總列數有上限
+            jump_start = month_start - relativedelta(months=2)
+            st.caption(f"可選日期範圍：{jump_start} ~ {month_end - timedelta(days=1)} (依上方選擇的月份)")
+            date_totals = get_ledger_totals(jump_start.isoformat(), month_end.isoformat(), group="date")
+            available_dates = sorted(pd.to_datetime(date_totals['group_key'].dropna().unique()).date, reverse=True)
             selected_dates = st.multiselect("請選擇日期 (可多選)", options=available_dates, placeholder="例如: 選擇 1月2號 和 1月8號")
             
             if selected_dates:
-                range_df = df[df['date'].isin(selected_dates)].sort_values('date', ascending=False)
+                date_keys = [d.isoformat() for d in selected_dates]
+                range_df = get_range_records(None, None, tuple(date_keys)).sort_values('date', ascending=False)
+                range_totals = date_totals[date_totals['group_key'].isin(date_keys)]
             else:
                 st.info("👆 請先在上方選單選擇日期")
 
@@ -723,14 +1259,75 @@ else:
                 with st.expander("查看選取項目明細"):
                     st.dataframe(selected_rows.drop(columns=['Select']), use_container_width=True)
             else:
-                total_in_range_exp = range_df[range_df['type']=='支出']['amount'].sum()
-                c_calc1.metric("清單總筆數", f"{len(range_df)} 筆")
+                total_in_range_exp = sum_by_type(range_totals, '支出')
+                c_calc1.metric("清單總筆數", f"{range_totals['count'].sum()} 筆")
                 c_calc2.metric("清單總支出", f"${total_in_range_exp:,.0f}")
                 c_calc3.info("💡 請勾選上方表格來計算特定項目")
                 
         elif filter_type == "📆 連續日期範圍":
              st.info("該日期範圍內沒有交易資料。")
 
+    with tab6:
+        st.subheader("🧾 信用卡帳單對帳")
+        st.caption("上傳信用卡帳單 CSV，系統會依金額與日期比對帳本，找出漏記與多記的項目。")
+
+        card_options = [name for name, cfg in CREDIT_CARDS_CONFIG.items() if cfg.get('cutoff', 0) > 0]
+        if not card_options:
+            st.info("尚未設定任何有結帳日的信用卡。")
+        else:
+            col_r1, col_r2, col_r3 = st.columns(3)
+            recon_card = col_r1.selectbox("信用卡", card_options, key="recon_card")
+            # 帳單月份依 calculate_cash_flow_info() 的規則：結帳日後的消費算下個月帳單，所以要能選到下個月
+            this_month = date.today().replace(day=1)
+            billing_months = [(this_month + relativedelta(months=offset)).strftime("%Y-%m") for offset in range(1, -13, -1)]
+            recon_month = col_r2.selectbox("帳單月份", billing_months, index=1, key="recon_month")
+            tolerance = col_r3.number_input("日期容許誤差 (天)", min_value=0, max_value=10, value=3, key="recon_tol")
+
+            statement_file = st.file_uploader("上傳帳單 CSV", type=["csv"], key="recon_file")
+            if statement_file is not None:
+                try:
+                    statement_raw = pd.read_csv(statement_file)
+                except Exception as e:
+                    st.error(f"無法讀取 CSV: {e}")
+                    statement_raw = pd.DataFrame()
+
+                if not statement_raw.empty:
+                    cols = list(statement_raw.columns)
+                    guess = lambda keys, fallback: next((i for i, c in enumerate(cols) if any(k in str(c).lower() for k in keys)), fallback)
+                    col_m1, col_m2, col_m3 = st.columns(3)
+                    date_col = col_m1.selectbox("日期欄位", cols, index=guess(["date", "日期"], 0), key="recon_date_col")
+                    amount_col = col_m2.selectbox("金額欄位", cols, index=guess(["amount", "金額"], min(1, len(cols) - 1)), key="recon_amount_col")
+                    desc_col = col_m3.selectbox("說明欄位", cols, index=guess(["desc", "說明", "摘要", "商店"], len(cols) - 1), key="recon_desc_col")
+
+                    statement_lines, skipped_lines = parse_statement_csv(statement_raw, date_col, amount_col, desc_col)
+                    if not skipped_lines.empty:
+                        st.warning(f"⚠️ 有 {len(skipped_lines)} 列無法解析日期或金額，未納入比對，請檢查欄位或格式。")
+                        with st.expander("查看未納入比對的列"):
+                            st.dataframe(skipped_lines, use_container_width=True)
+                    ledger_period_df = get_statement_ledger(recon_card, recon_month)
+                    matched, missing, extra = reconcile_statement(
+                        statement_lines, ledger_period_df.to_dict('records'), tolerance_days=int(tolerance)
+                    )
+
+                    m1, m2, m3 = st.columns(3)
+                    m1.metric("✅ 已對上", f"{len(matched)} 筆")
+                    m2.metric("❓ 帳單有、帳本沒有", f"{len(missing)} 筆", delta=f"${sum(r['amount'] for r in missing):,.0f}", delta_color="off")
+                    m3.metric("⚠️ 帳本有、帳單沒有", f"{len(extra)} 筆", delta=f"${sum(float(r['amount']) for r in extra):,.0f}", delta_color="off")
+
+                    if missing:
+                        st.write("❓ 帳本漏記 (帳單上有)")
+                        st.dataframe(pd.DataFrame(missing), use_container_width=True, hide_index=True)
+                    if extra:
+                        st.write("⚠️ 帳單上找不到的帳本紀錄")
+                        st.dataframe(pd.DataFrame(extra)[['date', 'category', 'amount', 'note', 'tags']], use_container_width=True, hide_index=True)
+                    if matched:
+                        with st.expander("查看已對上的項目"):
+                            st.dataframe(pd.DataFrame([
+                                {"帳單日期": s_row['date'], "帳本日期": l_row['date'], "金額": s_row['amount'],
+                                 "帳單說明": s_row['description'], "帳本備註": l_row['note']}
+                                for s_row, l_row in matched
+                            ]), use_container_width=True, hide_index=True)
+
     st.markdown("---")
     
     # ==========================================
@@ -741,73 +1338,160 @@ else:
     all_cats = expense_cats + income_cats + ["其他"]
     all_pm = list(CREDIT_CARDS_CONFIG.keys())
 
-    edited_df = st.data_editor(
-        current_month_df.sort_values('date', ascending=False),
-        column_config={
-            "id": None, 
-            "created_at": None,
-            "deleted_at": None,
-            "date": st.column_config.DateColumn("消費日期", format="YYYY-MM-DD", required=True),
-            "cash_flow_date": st.column_config.DateColumn("現金流/繳款日", disabled=True), 
-            "type": st.column_config.SelectboxColumn("類型", options=["支出", "收入"], required=True, width="small"),
-            "category": st.column_config.SelectboxColumn("類別", options=all_cats, required=True),
-            "payment_method": st.column_config.SelectboxColumn("付款方式", options=all_pm, required=True),
-            "amount": st.column_config.NumberColumn("金額", format="$ %.0f", required=True),
-            "tags": st.column_config.TextColumn("標籤"),
-            "note": st.column_config.TextColumn("備註"),
-        },
-        use_container_width=True,
-        num_rows="dynamic",
-        hide_index=True,
-        key="data_editor_main"
-    )
-
-    if st.button("💾 儲存變更"):
-        with st.spinner("正在同步資料庫..."):
-            original_map = current_month_df.set_index('id').to_dict('index')
-            current_ids = set(row['id'] for i, row in edited_df.iterrows() if row['id'])
-            original_ids = set(original_map.keys())
+    editor_column_config = {
+        "id": None, 
+        "created_at": None,
+        "deleted_at": None,
+        "tag_list": None,
+        "date": st.column_config.DateColumn("消費日期", format="YYYY-MM-DD", required=True),
+        "cash_flow_date": st.column_config.DateColumn("現金流/繳款日", disabled=True), 
+        "type": st.column_config.SelectboxColumn("類型", options=["支出", "收入"], required=True, width="small"),
+        "category": st.column_config.SelectboxColumn("類別", options=all_cats, required=True),
+        "payment_method": st.column_config.SelectboxColumn("付款方式", options=all_pm, required=True),
+        "amount": st.column_config.NumberColumn("金額", format="$ %.0f", required=True),
+        "tags": st.column_config.TextColumn("標籤"),
+        "note": st.column_config.TextColumn("備註"),
+    }
+
+    editor_mode = st.radio("編輯模式", ["📄 分頁編輯", "📜 整月編輯"], horizontal=True, key="editor_mode")
+
+    if editor_mode == "📄 分頁編輯":
+        # 篩選/排序/切頁都交給資料庫，瀏覽器每次只收到一頁資料
+        col_p1, col_p2, col_p3, col_p4 = st.columns(4)
+        sort_label = col_p1.selectbox("排序欄位", list(EDITOR_SORT_OPTIONS.keys()), key="editor_sort")
+        sort_desc = col_p2.radio("順序", ["由新到舊/大到小", "由舊到新/小到大"], key="editor_order") == "由新到舊/大到小"
+        type_filter = col_p3.selectbox("類型篩選", ["全部", "支出", "收入"], key="editor_type")
+        page_size = col_p4.selectbox("每頁筆數", [25, 50, 100], index=1, key="editor_page_size")
+        type_value = "" if type_filter == "全部" else type_filter
+
+        page_query = (month_start.isoformat(), month_end.isoformat(), tag_filter, type_value, EDITOR_SORT_OPTIONS[sort_label], sort_desc)
+        page_no = int(st.session_state.get('editor_page', 1))
+        base_page_df, total_count = get_records_page(*page_query, page_no - 1, page_size)
+        total_pages = max(1, -(-total_count // page_size))
+        if page_no > total_pages:
+            # 篩選條件變動後頁數變少，跳回最後一頁
+            page_no = total_pages
+            st.session_state.editor_page = page_no
+            base_page_df, total_count = get_records_page(*page_query, page_no - 1, page_size)
+        st.number_input(f"頁數 (共 {total_pages} 頁，{total_count} 筆)", min_value=1, max_value=total_pages, step=1, key="editor_page")
+
+        # 同一頁面停留期間固定編輯器輸入，切頁時才重新套用暫存的變更
+        page_key = "|".join([selected_month, tag_filter, type_value, sort_label, str(sort_desc), str(page_size), str(page_no),
+                             str(st.session_state.get('editor_generation', 0))])
+        # 比對基準必須是建立快照時的那份資料，而不是之後重新抓的頁面 (可能多了別處新增的資料列)
+        snapshot_key = f"{page_key}|v{st.session_state.get('ledger_version', 0)}"
+        if st.session_state.get('editor_snapshot_key') != snapshot_key:
+            st.session_state.editor_snapshot_key = snapshot_key
+            st.session_state.editor_snapshot_base = base_page_df
+            st.session_state.editor_snapshot = build_page_snapshot(base_page_df, page_key)
+
+        edited_page_df = st.data_editor(
+            st.session_state.editor_snapshot,
+            column_config=editor_column_config,
+            use_container_width=True,
+            num_rows="dynamic",
+            hide_index=True,
+            key=f"data_editor_page_{snapshot_key}"
+        )
+        collect_page_changes(edited_page_df, st.session_state.editor_snapshot_base, page_key)
+
+        pending = get_pending_edits()
+        pending_adds = sum(len(rows) for rows in pending['adds'].values())
+        st.caption(f"📝 未儲存變更：修改 {len(pending['edits'])} 筆、刪除 {len(pending['deletes'])} 筆、新增 {pending_adds} 筆 (切換頁面會保留)")
+
+        col_s1, col_s2 = st.columns([1, 5])
+        if col_s1.button("💾 儲存變更", key="save_paged"):
+            if pending['edits'] or pending['deletes'] or pending_adds:
+                with st.spinner("正在同步資料庫..."):
+                    changes_count, delete_count, add_count = flush_pending_edits()
+                st.success(f"✅ 同步完成！更新 {changes_count} 筆，刪除 {delete_count} 筆，新增 {add_count} 筆。")
+                time.sleep(1)
+                st.rerun()
+            else:
+                st.info("沒有偵測到任何變更。")
+        if col_s2.button("↩️ 放棄所有未儲存變更", key="discard_paged"):
+            reset_pending_edits()
+            st.rerun()
+
+    else:
+        # 只有整月編輯需要下載整月明細
+        if tag_filter:
+            # 標籤篩選走資料庫索引，不在下載後的資料上做字串比對
+            current_month_df = get_tagged_records(month_start.isoformat(), month_end.isoformat(), tag_filter)
+        else:
+            current_month_df = get_range_records(month_start.isoformat(), month_end.isoformat())
+
+        edited_df = st.data_editor(
+            current_month_df.sort_values('date', ascending=False),
+            column_config=editor_column_config,
+            use_container_width=True,
+            num_rows="dynamic",
+            hide_index=True,
+            key="data_editor_main"
+        )
+
+        if st.button("💾 儲存變更", key="save_full"):
+            with st.spinner("正在同步資料庫..."):
+                original_map = current_month_df.set_index('id').to_dict('index')
+                current_ids = set(row['id'] for i, row in edited_df.iterrows() if row['id'])
+                original_ids = set(original_map.keys())
             
-            changes_count = 0
-            delete_count = 0
-
-            # 1. 刪除
-            deleted_ids = original_ids - current_ids
-            for uid in deleted_ids:
-                delete_transaction(uid)
-                delete_count += 1
-
-            # 2. 修改
-            progress_bar = st.progress(0)
-            total_rows = len(edited_df)
+                changes_count = 0
+                delete_count = 0
+
+                # 1. 刪除
+                deleted_ids = original_ids - current_ids
+                for uid in deleted_ids:
+                    delete_transaction(uid)
+                    delete_count += 1
+
+                # 2. 修改
+                progress_bar = st.progress(0)
+                total_rows = len(edited_df)
             
-            for i, (idx, row) in enumerate(edited_df.iterrows()):
-                uid = row['id']
-                if not uid or uid not in original_map: continue 
-                
-                orig = original_map[uid]
+                for i, (idx, row) in enumerate(edited_df.iterrows()):
+                    uid = row['id']
+                    if not uid or uid not in original_map: continue 
                 
-                has_changed = (
-                    str(row['date']) != str(orig['date']) or 
-                    row['type'] != orig['type'] or 
-                    row['category'] != orig['category'] or 
-                    float(row['amount']) != float(orig['amount']) or 
-                    row['payment_method'] != orig['payment_method'] or
-                    str(row['tags']) != str(orig['tags']) or
-                    str(row['note']) != str(orig['note'])
-                )
+                    orig = original_map[uid]
                 
-                if has_changed:
-                    if safe_update_transaction(row, orig):
-                        changes_count += 1
+                    if row_has_changed(row, orig):
+                        if safe_update_transaction(row, orig):
+                            changes_count += 1
                 
-                if total_rows > 0:
-                    progress_bar.progress((i + 1) / total_rows)
+                    if total_rows > 0:
+                        progress_bar.progress((i + 1) / total_rows)
             
-            if changes_count > 0 or delete_count > 0:
-                st.success(f"✅ 同步完成！更新 {changes_count} 筆，刪除 {delete_count} 筆。")
-                get_data.clear()
-                time.sleep(1)
-                st.rerun()
-            else:
-                st.info("沒有偵測到任何變更。")
\ No newline at end of file
+                if changes_count > 0 or delete_count > 0:
+                    st.success(f"✅ 同步完成！更新 {changes_count} 筆，刪除 {delete_count} 筆。")
+                    clear_ledger_cache()
+                    time.sleep(1)
+                    st.rerun()
+                else:
+                    st.info("沒有偵測到任何變更。")
+
+# ==========================================
+# 🗄️ 封存資料查詢 (需要時才讀取)
+# ==========================================
+with st.expander("🗄️ 查詢封存資料"):
+    col_a1, col_a2 = st.columns(2)
+    a_start = col_a1.date_input("開始日期", datetime.now().replace(month=1, day=1) - relativedelta(years=1), key="archive_start")
+    a_end = col_a2.date_input("結束日期", datetime.now(), key="archive_end")
+    
+    if st.button("🔍 查詢封存"):
+        try:
+            archived_df = get_archived_records(a_start.isoformat(), (a_end + timedelta(days=1)).isoformat())
+        except Exception as e:
+            st.error(f"讀取封存資料失敗: {e}")
+            archived_df = pd.DataFrame()
+        
+        if archived_df.empty:
+            st.info("該期間沒有封存資料。")
+        else:
+            st.caption(f"共 {len(archived_df)} 筆")
+            st.dataframe(
+                archived_df[['date', 'type', 'category', 'amount', 'payment_method', 'tags', 'note', 'deleted_at']],
+                use_container_width=True,
+                hide_index=True,
+                column_config={"amount": st.column_config.NumberColumn("金額", format="$ %d")}
+            )
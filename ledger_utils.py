@@ -0,0 +1,160 @@
+"""帳務的純邏輯工具：不依賴 Streamlit 與資料庫連線，app.py 與 local_db.py 共用，也方便測試。"""
+import math
+import re
+import unicodedata
+
+
+def is_missing(value):
+    """None 或 NaN (pandas 空值) 都視為缺值"""
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+# ==========================================
+# 🏷️ 標籤
+# ==========================================
+def normalize_tag(tag):
+    tag = str(tag).strip()
+    if not tag: return ""
+    return tag if tag.startswith("#") else f"#{tag}"
+
+
+def split_tags(tags_str):
+    """逗號分隔的標籤字串 -> 正規化清單 (與資料庫的 split_tags() / tag_list 一致)"""
+    if is_missing(tags_str): return []
+    tags = [normalize_tag(t) for t in str(tags_str).split(',')]
+    return sorted(set(t for t in tags if t))
+
+
+# ==========================================
+# 🧬 重複交易偵測
+# ==========================================
+def normalize_note(note):
+    """備註正規化：全半形統一、去空白、轉小寫"""
+    if is_missing(note): return ""
+    return re.sub(r'\s+', '', unicodedata.normalize('NFKC', str(note))).lower()
+
+
+def installment_amount(amount, installment_months=1):
+    """實際寫入資料庫的每期金額 (取整)，指紋要用這個值才對得上帳本"""
+    return round(amount / installment_months)
+
+
+def transaction_fingerprint(date_val, amount, note, payment_method):
+    """(日期, 金額, 正規化備註, 付款方式) 組成的指紋"""
+    date_str = date_val.strftime("%Y-%m-%d") if hasattr(date_val, 'strftime') else str(date_val)
+    return (date_str, round(float(amount), 2), normalize_note(note), str(payment_method))
+
+
+def match_duplicates(records, fingerprints):
+    """逐筆 O(1) 查詢指紋索引 (指紋 -> 帳本筆數)，回傳每筆是否疑似重複。
+    帳本中同指紋有 N 筆時，批次中前 N 筆視為重複，超出的才算新資料 (例如同天買兩杯一樣的咖啡)。"""
+    used = {}
+    flags = []
+    for item in records:
+        fp = transaction_fingerprint(item['date'], item['amount'], item['note'], item['payment_method'])
+        matched = used.get(fp, 0)
+        if matched < fingerprints.get(fp, 0):
+            used[fp] = matched + 1
+            flags.append(True)
+        else:
+            flags.append(False)
+    return flags
+
+
+# ==========================================
+# 📄 編輯器差異比對
+# ==========================================
+def row_has_changed(row, orig):
+    """比對編輯後與原始資料列是否有差異"""
+    return (
+        str(row['date']) != str(orig['date']) or
+        row['type'] != orig['type'] or
+        row['category'] != orig['category'] or
+        float(row['amount']) != float(orig['amount']) or
+        row['payment_method'] != orig['payment_method'] or
+        str(row['tags']) != str(orig['tags']) or
+        str(row['note']) != str(orig['note'])
+    )
+
+
+def is_new_row(uid):
+    return is_missing(uid) or uid == ""
+
+
+# ==========================================
+# 🎯 分類/標籤預算
+# ==========================================
+def budget_keys_for_row(row):
+    """一筆支出會計入哪些預算：所屬類別 + 每個標籤"""
+    if row.get('type') != '支出': return []
+    keys = [f"category:{row.get('category')}"]
+    keys += [f"tag:{t}" for t in split_tags(row.get('tags'))]
+    return keys
+
+
+def collect_budget_deltas(old_rows=(), new_rows=()):
+    """舊資料列扣除、新資料列加回，得到 (月份, 預算 key) -> 金額增量"""
+    deltas = {}
+    for sign, rows in ((-1, old_rows), (1, new_rows)):
+        for row in rows:
+            if not row: continue
+            month = str(row['date'])[:7]
+            for key in budget_keys_for_row(row):
+                deltas[(month, key)] = deltas.get((month, key), 0) + sign * float(row['amount'])
+    return deltas
+
+
+def escape_like(text):
+    """跳脫 LIKE 的萬用字元，標籤可能含有 _ (來自 #(\\w+))"""
+    return str(text).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+# ==========================================
+# 🧾 信用卡帳單對帳
+# ==========================================
+def parse_amount(text):
+    """帳單金額字串 -> float：去掉千分位與幣別符號，括號 (300) 表示負數 (退款)；無法解析回傳 None"""
+    if is_missing(text): return None
+    text = str(text).strip()
+    negative = text.startswith("(") and text.endswith(")")
+    try:
+        value = float(re.sub(r'[^\d.\-]', '', text))
+    except ValueError:
+        return None
+    return -abs(value) if negative else value
+
+
+def reconcile_statement(statement_lines, ledger_rows, tolerance_days=3):
+    """帳單對帳：兩邊都依 (金額, 日期) 排序後用雙指標合併，O((n+m) log(n+m))。
+    回傳 (matched, missing, extra)：matched 為 (帳單列, 帳本列)；missing 是帳單有但帳本沒記；extra 是帳本有但帳單沒有。"""
+    stmt = sorted(statement_lines, key=lambda r: (r['amount'], r['date']))
+    ledger = sorted(ledger_rows, key=lambda r: (round(float(r['amount']), 2), r['date']))
+
+    matched, missing, extra = [], [], []
+    i = j = 0
+    while i < len(stmt) and j < len(ledger):
+        s_row, l_row = stmt[i], ledger[j]
+        l_amount = round(float(l_row['amount']), 2)
+        if s_row['amount'] < l_amount:
+            missing.append(s_row)
+            i += 1
+        elif s_row['amount'] > l_amount:
+            extra.append(l_row)
+            j += 1
+        else:
+            # 同金額群組內依日期排序，落在容許天數內就配對，否則較早的那筆無法再被配對
+            gap = (s_row['date'] - l_row['date']).days
+            if abs(gap) <= tolerance_days:
+                matched.append((s_row, l_row))
+                i += 1
+                j += 1
+            elif gap < 0:
+                missing.append(s_row)
+                i += 1
+            else:
+                extra.append(l_row)
+                j += 1
+
+    missing += stmt[i:]
+    extra += ledger[j:]
+    return matched, missing, extra
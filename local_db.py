@@ -0,0 +1,132 @@
+"""本機 SQLite 替身：提供與 Supabase 相同的資料表與彙總 RPC，方便離線測試。
+
+app.py 在 Streamlit 載入時就會連線，無法直接 import，因此這裡只放純資料庫邏輯。
+"""
+import sqlite3
+import uuid
+
+from ledger_utils import split_tags
+
+SCHEMA = """
+create table if not exists transactions (
+    id text primary key,
+    date text not null,
+    cash_flow_date text,
+    type text,
+    category text,
+    amount real,
+    payment_method text,
+    tags text,
+    note text,
+    created_at text default current_timestamp,
+    deleted_at text
+);
+create index if not exists transactions_live_date_idx on transactions (date) where deleted_at is null;
+
+create table if not exists transactions_archive (
+    id text primary key,
+    date text not null,
+    cash_flow_date text,
+    type text,
+    category text,
+    amount real,
+    payment_method text,
+    tags text,
+    note text,
+    created_at text,
+    deleted_at text,
+    archived_at text default current_timestamp
+);
+
+create table if not exists probe_scratch (
+    id integer primary key autoincrement,
+    batch_id text not null,
+    payload text,
+    created_at text default current_timestamp
+);
+
+create table if not exists app_settings (
+    id integer primary key autoincrement,
+    section text,
+    key_name text,
+    value text
+);
+"""
+
+# 與 ledger_group_value() 對應的 SQLite 寫法 (週以週一為起點)
+GROUP_EXPRESSIONS = {
+    "category": "category",
+    "payment_method": "payment_method",
+    "date": "date",
+    "week": "date(date, '-' || ((cast(strftime('%w', date) as integer) + 6) % 7) || ' days')",
+    "month": "strftime('%Y-%m', date)",
+    "cash_flow_date": "cash_flow_date",
+}
+
+
+def connect(path=":memory:"):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.create_function("has_tag", 2, lambda tags, tag: tag in split_tags(tags))
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def insert_transactions(conn, rows):
+    """寫入交易資料列 (沒有 id 的會自動補上)，回傳寫入筆數"""
+    columns = ["id", "date", "cash_flow_date", "type", "category", "amount", "payment_method", "tags", "note"]
+    values = [
+        tuple(str(uuid.uuid4()) if c == "id" and not row.get("id") else row.get(c) for c in columns)
+        for row in rows
+    ]
+    conn.executemany(f"insert into transactions ({', '.join(columns)}) values ({', '.join('?' * len(columns))})", values)
+    conn.commit()
+    return len(values)
+
+
+def ledger_totals(conn, p_start=None, p_end=None, p_group=None, p_sub_group=None,
+                  p_type=None, p_category=None, p_payment_method=None, p_tag=None):
+    """ledger_totals() RPC 的替身，回傳格式與 supabase.rpc(...).data 相同"""
+    group_expr = GROUP_EXPRESSIONS.get(p_group, "null")
+    sub_expr = GROUP_EXPRESSIONS.get(p_sub_group, "null")
+    filters = [
+        ("date >= ?", p_start),
+        ("date < ?", p_end),
+        ("type = ?", p_type),
+        ("category = ?", p_category),
+        ("payment_method = ?", p_payment_method),
+        ("has_tag(tags, ?)", p_tag),
+    ]
+    where = ["deleted_at is null"] + [clause for clause, value in filters if value is not None]
+    params = [str(value) for _, value in filters if value is not None]
+
+    sql = f"""
+        select {group_expr} as group_key, {sub_expr} as sub_key, type, sum(amount) as total, count(*) as count
+        from transactions
+        where {' and '.join(where)}
+        group by 1, 2, 3
+        order by 1, 2, 3
+    """
+    return [dict(row) for row in conn.execute(sql, params).fetchall()]
+
+
+def archive_transactions(conn, p_retention_days=90, p_batch_size=500, p_closed_before=None):
+    """archive_transactions() 的替身：搬移一批資料到封存表，回傳搬移筆數。
+    App 以本地時間 (datetime.now().isoformat()) 寫入 deleted_at，所以這裡也用本地時間比較。"""
+    ids = [row["id"] for row in conn.execute(
+        """
+        select id from transactions
+        where (deleted_at is not null and julianday(deleted_at) < julianday('now', 'localtime') - ?)
+           or (? is not null and date < ?)
+        limit ?
+        """,
+        (p_retention_days, p_closed_before, p_closed_before, p_batch_size),
+    ).fetchall()]
+    if not ids: return 0
+
+    placeholders = ", ".join("?" * len(ids))
+    columns = "id, date, cash_flow_date, type, category, amount, payment_method, tags, note, created_at, deleted_at"
+    with conn:
+        conn.execute(f"insert into transactions_archive ({columns}) select {columns} from transactions where id in ({placeholders})", ids)
+        conn.execute(f"delete from transactions where id in ({placeholders})", ids)
+    return len(ids)
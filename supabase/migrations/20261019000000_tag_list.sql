@@ -0,0 +1,48 @@
+-- 標籤正規化：把逗號分隔的 tags 字串拆成 text[]，並建立 GIN 索引
+-- tags 仍保留作為顯示用字串；tag_list 由 trigger 自動同步，App 不需要另外寫入
+
+alter table transactions add column if not exists tag_list text[] not null default '{}';
+
+-- "#旅遊, 出差" -> {"#旅遊","#出差"}
+create or replace function split_tags(p_tags text)
+returns text[]
+language sql immutable as $$
+    select coalesce(array_agg(distinct case when left(tag, 1) = '#' then tag else '#' || tag end), '{}')
+    from (select btrim(raw) as tag from unnest(string_to_array(coalesce(p_tags, ''), ',')) as raw) s
+    where tag <> '';
+$$;
+
+create or replace function transactions_sync_tag_list()
+returns trigger
+language plpgsql as $$
+begin
+    new.tag_list := split_tags(new.tags);
+    return new;
+end;
+$$;
+
+drop trigger if exists transactions_sync_tag_list on transactions;
+create trigger transactions_sync_tag_list
+    before insert or update of tags on transactions
+    for each row execute function transactions_sync_tag_list();
+
+-- 回填既有資料
+update transactions set tag_list = split_tags(tags);
+
+create index if not exists transactions_tag_list_gin on transactions using gin (tag_list);
+
+-- 標籤彙總：直接在資料庫 unnest + group by，只回傳每個標籤一列
+create or replace function tag_totals(p_start date, p_end date, p_tag text default null)
+returns table (tag text, count bigint, total_spent numeric)
+language sql stable as $$
+    select t.tag,
+           count(*) as count,
+           coalesce(sum(tr.amount) filter (where tr.type = '支出'), 0) as total_spent
+    from transactions tr
+    cross join lateral unnest(tr.tag_list) as t(tag)
+    where tr.deleted_at is null
+      and tr.date >= p_start and tr.date < p_end
+      and (p_tag is null or tr.tag_list @> array[p_tag])
+    group by t.tag
+    order by total_spent desc;
+$$;
@@ -0,0 +1,49 @@
+-- 儀表板彙總：在資料庫 group by，App 只拿回彙總後的少量資料列
+
+create index if not exists transactions_live_date_idx on transactions (date) where deleted_at is null;
+
+-- 依 p_key 取出分組欄位的值 (統一轉成文字)；週以週一為起點
+-- 日期轉文字會受 DateStyle 影響，所以宣告為 stable 而非 immutable
+create or replace function ledger_group_value(tr transactions, p_key text)
+returns text
+language sql stable as $$
+    select case p_key
+        when 'category' then tr.category
+        when 'payment_method' then tr.payment_method
+        when 'date' then tr.date::text
+        when 'week' then (tr.date - extract(isodow from tr.date)::int + 1)::text
+        when 'month' then to_char(tr.date, 'YYYY-MM')
+        when 'cash_flow_date' then tr.cash_flow_date::text
+        else null
+    end;
+$$;
+
+-- 期間 [p_start, p_end) 內依 (p_group, p_sub_group, type) 加總；所有篩選條件為 null 時不套用
+create or replace function ledger_totals(
+    p_start date default null,
+    p_end date default null,
+    p_group text default null,
+    p_sub_group text default null,
+    p_type text default null,
+    p_category text default null,
+    p_payment_method text default null,
+    p_tag text default null
+)
+returns table (group_key text, sub_key text, type text, total numeric, count bigint)
+language sql stable as $$
+    select ledger_group_value(tr, p_group) as group_key,
+           ledger_group_value(tr, p_sub_group) as sub_key,
+           tr.type,
+           sum(tr.amount) as total,
+           count(*) as count
+    from transactions tr
+    where tr.deleted_at is null
+      and (p_start is null or tr.date >= p_start)
+      and (p_end is null or tr.date < p_end)
+      and (p_type is null or tr.type = p_type)
+      and (p_category is null or tr.category = p_category)
+      and (p_payment_method is null or tr.payment_method = p_payment_method)
+      and (p_tag is null or tr.tag_list @> array[p_tag])
+    group by 1, 2, 3
+    order by 1, 2, 3;
+$$;
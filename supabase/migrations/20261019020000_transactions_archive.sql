@@ -0,0 +1,46 @@
+-- 封存：把超過保留期的軟刪除資料 (以及可選的已結算年度) 搬到 transactions_archive
+-- 日常查詢只掃 transactions 的有效資料，封存資料需要時再查
+
+create table if not exists transactions_archive (like transactions including defaults);
+alter table transactions_archive add column if not exists archived_at timestamptz not null default now();
+
+create index if not exists transactions_archive_date_idx on transactions_archive (date);
+create index if not exists transactions_tombstone_idx on transactions (deleted_at) where deleted_at is not null;
+
+-- 每次呼叫最多搬 p_batch_size 筆，回傳實際搬移筆數；由呼叫端重複呼叫直到回傳值小於批次大小
+create or replace function archive_transactions(
+    p_retention_days integer default 90,
+    p_batch_size integer default 500,
+    p_closed_before date default null
+)
+returns integer
+language plpgsql as $$
+declare
+    moved_count integer;
+begin
+    with batch as (
+        select id
+        from transactions
+        where (deleted_at is not null and deleted_at < now() - make_interval(days => p_retention_days))
+           or (p_closed_before is not null and date < p_closed_before)
+        limit p_batch_size
+        for update skip locked
+    ), moved as (
+        delete from transactions tr
+        using batch
+        where tr.id = batch.id
+        returning tr.*
+    )
+    -- 明確列出欄位，transactions 日後新增欄位也不會錯位
+    insert into transactions_archive (
+        id, date, cash_flow_date, type, category, amount, payment_method,
+        tags, note, created_at, deleted_at, tag_list, archived_at
+    )
+    select id, date, cash_flow_date, type, category, amount, payment_method,
+           tags, note, created_at, deleted_at, tag_list, now()
+    from moved;
+
+    get diagnostics moved_count = row_count;
+    return moved_count;
+end;
+$$;
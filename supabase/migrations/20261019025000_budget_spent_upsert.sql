@@ -0,0 +1,44 @@
+-- 預算累計支出的原子更新：value = value + delta，避免從用戶端讀取後再寫回造成競態
+
+-- 先合併可能重複的 budget_spent 資料列，才能建立唯一索引
+with merged as (
+    select key_name, min(id) as keep_id, sum(value::numeric) as total
+    from app_settings
+    where section = 'budget_spent'
+    group by key_name
+    having count(*) > 1
+), kept as (
+    update app_settings s
+    set value = merged.total::text
+    from merged
+    where s.id = merged.keep_id
+    returning s.id, s.key_name
+)
+delete from app_settings s
+using kept
+where s.section = 'budget_spent' and s.key_name = kept.key_name and s.id <> kept.id;
+
+create unique index if not exists app_settings_budget_spent_key
+    on app_settings (section, key_name) where section = 'budget_spent';
+
+-- p_deltas: [{"key_name": "2026-10|category:飲食", "delta": 120}, ...]
+-- 回傳每個 key 更新前後的累計值，供 App 判斷是否跨過警示門檻
+create or replace function apply_budget_deltas(p_deltas jsonb)
+returns table (budget_key text, old_spent numeric, new_spent numeric)
+language plpgsql as $$
+declare
+    d record;
+begin
+    for d in
+        select e->>'key_name' as k, (e->>'delta')::numeric as delta
+        from jsonb_array_elements(p_deltas) as e
+    loop
+        return query
+            insert into app_settings as s (section, key_name, value)
+            values ('budget_spent', d.k, d.delta::text)
+            on conflict (section, key_name) where section = 'budget_spent'
+            do update set value = (s.value::numeric + d.delta)::text
+            returning s.key_name::text, s.value::numeric - d.delta, s.value::numeric;
+    end loop;
+end;
+$$;
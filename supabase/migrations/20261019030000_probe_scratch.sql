@@ -0,0 +1,10 @@
+-- ping_db.py 延遲探測用的暫存表：每次探測批次寫入後立即刪除，不影響正式資料
+
+create table if not exists probe_scratch (
+    id uuid primary key default gen_random_uuid(),
+    batch_id text not null,
+    payload text,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists probe_scratch_batch_idx on probe_scratch (batch_id);
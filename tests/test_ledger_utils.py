@@ -0,0 +1,107 @@
+from datetime import date
+
+from ledger_utils import (
+    collect_budget_deltas, escape_like, installment_amount, is_new_row, match_duplicates,
+    normalize_note, parse_amount, reconcile_statement, row_has_changed, split_tags,
+    transaction_fingerprint,
+)
+
+
+def test_split_tags_normalizes_and_dedupes():
+    assert split_tags("#旅遊, 出差,,#旅遊 ") == ["#出差", "#旅遊"]
+    assert split_tags(None) == []
+    assert split_tags(float("nan")) == []
+
+
+def test_fingerprint_ignores_spacing_case_and_width():
+    a = transaction_fingerprint(date(2026, 2, 15), 163, "7-11 Coffee", "現金")
+    b = transaction_fingerprint("2026-02-15", 163.0, "７－１１coffee", "現金")
+    assert a == b
+    assert normalize_note(None) == ""
+
+
+def test_match_duplicates_counts_existing_occurrences():
+    fp = transaction_fingerprint("2026-02-15", 60, "咖啡", "現金")
+    coffee = {"date": date(2026, 2, 15), "amount": 60, "note": "咖啡", "payment_method": "現金"}
+    other = dict(coffee, amount=61)
+
+    # 帳本已有 1 杯，批次有 2 杯：第一杯重複、第二杯是新的
+    assert match_duplicates([coffee, coffee, other], {fp: 1}) == [True, False, False]
+    assert match_duplicates([coffee], {}) == [False]
+
+
+def test_match_duplicates_uses_the_stored_amount():
+    # "咖啡 12.5" 寫入時取整為 12，再貼一次要比對取整後的金額
+    fp = transaction_fingerprint("2026-02-15", installment_amount(12.5), "咖啡", "現金")
+    pasted = {"date": date(2026, 2, 15), "amount": 12.5, "note": "咖啡", "payment_method": "現金"}
+
+    assert match_duplicates([pasted], {fp: 1}) == [False]
+    assert match_duplicates([dict(pasted, amount=installment_amount(12.5))], {fp: 1}) == [True]
+    assert installment_amount(1000, 3) == 333
+
+
+def test_collect_budget_deltas_moves_amount_between_keys():
+    old = {"date": "2026-10-03", "type": "支出", "category": "飲食", "amount": 100, "tags": "#旅遊"}
+    new = dict(old, category="交通", amount=120)
+    deltas = collect_budget_deltas([old], [new])
+
+    assert deltas[("2026-10", "category:飲食")] == -100
+    assert deltas[("2026-10", "category:交通")] == 120
+    assert deltas[("2026-10", "tag:#旅遊")] == 20
+
+
+def test_collect_budget_deltas_ignores_income_and_empty_rows():
+    income = {"date": "2026-10-03", "type": "收入", "category": "薪資", "amount": 500, "tags": ""}
+    assert collect_budget_deltas([None], [income]) == {}
+
+
+def test_escape_like_escapes_wildcards():
+    assert escape_like("tag:#a_b") == "tag:#a\\_b"
+    assert escape_like("100%") == "100\\%"
+
+
+def test_row_has_changed_and_is_new_row():
+    row = {"date": date(2026, 1, 1), "type": "支出", "category": "飲食", "amount": 10,
+           "payment_method": "現金", "tags": "", "note": "a"}
+    assert not row_has_changed(row, dict(row, amount=10.0))
+    assert row_has_changed(row, dict(row, note="b"))
+    assert is_new_row(None) and is_new_row(float("nan")) and is_new_row("")
+    assert not is_new_row("abc")
+
+
+def test_parse_amount_handles_separators_and_parenthesised_credits():
+    assert parse_amount("NT$1,234.50") == 1234.5
+    assert parse_amount("(300)") == -300
+    assert parse_amount("-300") == -300
+    assert parse_amount(250.0) == 250
+    assert parse_amount("") is None
+    assert parse_amount(float("nan")) is None
+    assert parse_amount("1.2.3") is None
+
+
+def test_reconcile_statement_matches_within_tolerance():
+    stmt = [
+        {"date": date(2026, 1, 5), "amount": 100.0, "description": "A"},
+        {"date": date(2026, 1, 20), "amount": 100.0, "description": "B"},
+        {"date": date(2026, 1, 8), "amount": 250.0, "description": "C"},
+    ]
+    ledger = [
+        {"date": date(2026, 1, 6), "amount": 100, "note": "a"},
+        {"date": date(2026, 1, 10), "amount": 100, "note": "too far from B"},
+        {"date": date(2026, 1, 9), "amount": 75, "note": "extra"},
+    ]
+    matched, missing, extra = reconcile_statement(stmt, ledger, tolerance_days=3)
+
+    assert [(s["description"], l["note"]) for s, l in matched] == [("A", "a")]
+    assert sorted(r["description"] for r in missing) == ["B", "C"]
+    assert sorted(r["note"] for r in extra) == ["extra", "too far from B"]
+
+
+def test_reconcile_statement_handles_large_statements():
+    ledger = [{"date": date(2026, 1, 1 + i % 28), "amount": i % 500, "note": str(i)} for i in range(5000)]
+    stmt = [{"date": r["date"], "amount": float(r["amount"]), "description": ""} for r in ledger[:4000]]
+    matched, missing, extra = reconcile_statement(stmt, ledger)
+
+    assert len(matched) == 4000
+    assert missing == []
+    assert len(extra) == 1000
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import local_db
+
+
+@pytest.fixture
+def conn():
+    conn = local_db.connect()
+    yield conn
+    conn.close()
+
+
+def tx(**kwargs):
+    row = {"date": "2026-10-05", "type": "支出", "category": "飲食", "amount": 100,
+           "payment_method": "現金", "tags": "", "note": ""}
+    row.update(kwargs)
+    return row
+
+
+def test_insert_keeps_falsy_values(conn):
+    local_db.insert_transactions(conn, [tx(amount=0)])
+    row = conn.execute("select id, amount, tags, note from transactions").fetchone()
+
+    assert row["id"]
+    assert row["amount"] == 0
+    assert row["tags"] == "" and row["note"] == ""
+    assert local_db.ledger_totals(conn)[0]["total"] == 0
+
+
+def test_ledger_totals_groups_and_filters(conn):
+    local_db.insert_transactions(conn, [
+        tx(date="2026-10-05", amount=100, tags="#旅遊"),
+        tx(date="2026-10-07", amount=50, category="交通"),
+        tx(date="2026-10-07", type="收入", category="薪資", amount=500),
+        tx(date="2026-11-01", amount=999),
+    ])
+    totals = local_db.ledger_totals(conn, p_start="2026-10-01", p_end="2026-11-01")
+    assert {r["type"]: r["total"] for r in totals} == {"支出": 150, "收入": 500}
+
+    by_cat = local_db.ledger_totals(conn, "2026-10-01", "2026-11-01", p_group="category", p_type="支出")
+    assert {r["group_key"]: r["total"] for r in by_cat} == {"交通": 50, "飲食": 100}
+
+    tagged = local_db.ledger_totals(conn, p_tag="#旅遊")
+    assert [(r["total"], r["count"]) for r in tagged] == [(100, 1)]
+
+
+def test_ledger_totals_week_starts_on_monday(conn):
+    # 2026-10-07 是週三，2026-10-11 是週日
+    local_db.insert_transactions(conn, [tx(date="2026-10-07"), tx(date="2026-10-11")])
+    weeks = local_db.ledger_totals(conn, p_group="week")
+    assert [(r["group_key"], r["count"]) for r in weeks] == [("2026-10-05", 2)]
+
+
+def test_ledger_totals_excludes_deleted(conn):
+    local_db.insert_transactions(conn, [tx(id="a"), tx(id="b")])
+    conn.execute("update transactions set deleted_at = ? where id = 'a'", (datetime.now().isoformat(),))
+    assert local_db.ledger_totals(conn)[0]["count"] == 1
+
+
+def test_archive_moves_old_tombstones_in_batches(conn):
+    old = (datetime.now() - timedelta(days=200)).isoformat()
+    recent = (datetime.now() - timedelta(days=5)).isoformat()
+    local_db.insert_transactions(conn, [tx(id=f"old{i}") for i in range(5)] + [tx(id="recent"), tx(id="live")])
+    conn.execute("update transactions set deleted_at = ? where id like 'old%'", (old,))
+    conn.execute("update transactions set deleted_at = ? where id = 'recent'", (recent,))
+    conn.commit()
+
+    assert local_db.archive_transactions(conn, p_retention_days=90, p_batch_size=3) == 3
+    assert local_db.archive_transactions(conn, p_retention_days=90, p_batch_size=3) == 2
+    assert local_db.archive_transactions(conn, p_retention_days=90, p_batch_size=3) == 0
+
+    live_ids = {r["id"] for r in conn.execute("select id from transactions")}
+    archived = conn.execute("select count(*) from transactions_archive").fetchone()[0]
+    assert live_ids == {"recent", "live"}
+    assert archived == 5
+
+
+def test_archive_closed_years(conn):
+    local_db.insert_transactions(conn, [tx(id="2024", date="2024-12-31"), tx(id="2025", date="2025-01-01")])
+    assert local_db.archive_transactions(conn, p_closed_before="2025-01-01") == 1
+    assert [r["id"] for r in conn.execute("select id from transactions_archive")] == ["2024"]
@@ -0,0 +1,88 @@
+import json
+
+import ping_db
+
+
+def stats(p50, bytes_per_row=100.0, rows=10):
+    return {"p50_ms": p50, "p95_ms": p50, "max_ms": p50, "payload_bytes": int(bytes_per_row * rows),
+            "rows": rows, "bytes_per_row": bytes_per_row, "samples": 5}
+
+
+def test_percentile_nearest_rank():
+    values = [5, 1, 4, 2, 3]
+    assert ping_db.percentile(values, 50) == 3
+    assert ping_db.percentile(values, 95) == 5
+    assert ping_db.percentile([7], 50) == 7
+
+
+def test_month_range_wraps_year():
+    from datetime import date
+    assert ping_db.month_range(date(2026, 12, 15)) == ("2026-12-01", "2027-01-01")
+
+
+def test_run_probe_against_local_target():
+    results = ping_db.run_probe(ping_db.LocalTarget(seed_rows=20), repeat=3)
+
+    assert set(results) == {"settings_load", "month_select", "batch_insert", "batch_rollback"}
+    assert results["month_select"]["rows"] == 20
+    assert results["batch_insert"]["rows"] == ping_db.SCRATCH_BATCH_SIZE
+    # 寫入的暫存資料都有被刪回去
+    assert results["batch_rollback"]["rows"] == ping_db.SCRATCH_BATCH_SIZE
+    assert all(r["samples"] == 3 for r in results.values())
+
+
+def test_compute_baseline_uses_recent_runs_of_same_target():
+    history = [{"target": "local", "results": {"q": stats(1000)}}]
+    history += [{"target": "local", "results": {"q": stats(10 + i)}} for i in range(ping_db.BASELINE_RUNS)]
+    history += [{"target": "supabase", "results": {"q": stats(500)}}]
+    baseline = ping_db.compute_baseline(history, "local")
+
+    assert baseline["q"]["p50_ms"] == 14.5
+    assert baseline["q"]["bytes_per_row"] == 100.0
+
+
+def test_find_regressions_needs_ratio_and_absolute_gap():
+    baseline = {"q": {"p50_ms": 100, "bytes_per_row": 100}}
+    assert ping_db.find_regressions({"q": stats(200)}, baseline)
+    assert not ping_db.find_regressions({"q": stats(140)}, baseline)
+    # 比例超過但絕對差距很小 (雜訊) 不算
+    assert not ping_db.find_regressions({"q": stats(3)}, {"q": {"p50_ms": 1, "bytes_per_row": None}})
+
+
+def test_payload_growth_is_per_row():
+    baseline = {"q": {"p50_ms": 10, "bytes_per_row": 100}}
+    # 列數變多 (月份累積) 但每列大小不變：不提示
+    assert not ping_db.find_payload_growth({"q": stats(10, rows=1000)}, baseline)
+    assert ping_db.find_payload_growth({"q": stats(10, bytes_per_row=200)}, baseline)
+
+
+def test_main_local_writes_history_and_uses_baseline(tmp_path, capsys):
+    history_file = tmp_path / "history.jsonl"
+    args = ["--local", "--repeat", "2", "--history", str(history_file), "--fail-on-regression"]
+
+    assert ping_db.main(args) == 0
+    assert ping_db.main(args) == 0
+    entries = [json.loads(line) for line in history_file.read_text(encoding="utf-8").splitlines()]
+
+    assert len(entries) == 2
+    assert all(e["target"] == "local" for e in entries)
+    assert "基準" in capsys.readouterr().out
+
+
+def test_main_fails_on_latency_regression(tmp_path, monkeypatch):
+    history_file = tmp_path / "history.jsonl"
+    fast = {"target": "local", "results": {"month_select": stats(10)}}
+    history_file.write_text(json.dumps(fast) + "\n", encoding="utf-8")
+    monkeypatch.setattr(ping_db, "run_probe", lambda target, repeat: {"month_select": stats(500)})
+    args = ["--local", "--history", str(history_file)]
+
+    assert ping_db.main(args) == 0
+    assert ping_db.main(args + ["--fail-on-regression"]) == 1
+    last = json.loads(history_file.read_text(encoding="utf-8").splitlines()[-1])
+    assert last["regressions"]
+
+
+def test_main_requires_credentials(monkeypatch, tmp_path):
+    monkeypatch.delenv("SUPABASE_URL", raising=False)
+    monkeypatch.delenv("SUPABASE_KEY", raising=False)
+    assert ping_db.main(["--history", str(tmp_path / "h.jsonl")]) == 1